@@ -3,11 +3,10 @@
 # Robert Ritter
 # rritter@centriq.com
 
-import random
+import secrets
 import os
-import json
-import argparse
-import textwrap
+import sys
+import itertools
 
 
 class NumberTooLowError(ValueError):
@@ -26,6 +25,127 @@ class FileNotFoundError(IOError):
     pass
 
 
+# The characters passwords are built from, by ASCII code, and how
+# likely each one is to be chosen.  There's a 47% chance of a lower
+# case letter, a 25% chance of a numeral and a 28% chance of an upper
+# case letter, shared evenly among the characters in each group.
+_LETTERS = ''.join(map(chr, [*range(97, 123), *range(65, 91)]))
+_ALPHANUMERICS = ''.join(map(chr, [*range(97, 123), *range(48, 58),
+                                   *range(65, 91)]))
+_ALPHANUMERIC_WEIGHTS = [47 / 26] * 26 + [25 / 10] * 10 + [28 / 26] * 26
+
+# Special characters come in four ASCII ranges, each of which gets an
+# equal share of the special characters' weight.
+_SPECIAL_CHARACTERS = ''.join(map(chr, [*range(32, 48), *range(58, 65),
+                                        *range(91, 97), *range(123, 127)]))
+_SPECIAL_WEIGHTS = [5 / 16] * 16 + [5 / 7] * 7 + [5 / 6] * 6 + [5 / 4] * 4
+
+# When special characters are wanted, one character in five is special;
+# letters and numerals keep their relative weights among the other four.
+_MIXED_CHARACTERS = _ALPHANUMERICS + _SPECIAL_CHARACTERS
+_MIXED_WEIGHTS = ([weight * 0.8 for weight in _ALPHANUMERIC_WEIGHTS]
+                  + _SPECIAL_WEIGHTS)
+
+# Running totals of the weights above.  Given these, choices() finds
+# each character with a binary search instead of first adding up the
+# weights on every call.
+_ALPHANUMERIC_CUM_WEIGHTS = list(itertools.accumulate(_ALPHANUMERIC_WEIGHTS))
+_MIXED_CUM_WEIGHTS = list(itertools.accumulate(_MIXED_WEIGHTS))
+
+# Random values for both passwords and passphrases come from the
+# operating system, as with the secrets module, rather than from the
+# predictable Mersenne Twister.
+_RANDOM = secrets.SystemRandom()
+
+# The Diceware word list, which is stored in the script's directory and
+# loaded by _load_wordlist the first time it is needed.
+_SCRIPT_ROOT = os.path.dirname(os.path.realpath(__file__))
+_WORDLIST_PATH = os.path.join(_SCRIPT_ROOT, 'WordList.txt')
+_WORDLIST = None
+
+# Tables used to choose the words of passphrases, keyed by the number
+# of words in the passphrase and built by _passphrase_tables.
+_PASSPHRASE_TABLES = {}
+
+
+def _load_wordlist():
+    """
+    Return the Diceware word list as a list of words in dice-key order.
+
+    Raises:
+    FileNotFoundError -- if WordList.txt cannot be found
+
+    WordList.txt holds one word per line, in the order of the dice
+    keys 11111, 11112, ... 66666.  The file is read on the first call
+    only; later calls return the same list.
+    """
+    global _WORDLIST
+    if _WORDLIST is None:
+        # Load the Dice word list file or raise an exception.
+        try:
+            with open(_WORDLIST_PATH, 'r', encoding='utf-8') as f:
+                _WORDLIST = f.read().splitlines()
+        except OSError as e:
+            raise FileNotFoundError('the file could not be found') from e
+    return _WORDLIST
+
+
+def _passphrase_tables(num):
+    """
+    Return the tables used to choose the words of a passphrase.
+
+    Keyword arguments:
+    num -- number of words in passphrase
+
+    Raises:
+    FileNotFoundError -- if WordList.txt cannot be found
+
+    Returns: a tuple of (words_by_length, steps)
+
+    words_by_length maps each word length to the list of words of that
+    length.  steps[k][t] is a tuple of (lengths, cum_weights) for
+    choosing the next word when k more words will follow it and the
+    words chosen so far have t letters between them: the lengths the
+    word may have, and the running totals of how many passphrases
+    between 20 and 50 characters long (letters plus the spaces between
+    words) can be finished with each.  The tables are built on the
+    first call for each num only.
+    """
+    if num not in _PASSPHRASE_TABLES:
+        words_by_length = {}
+        for word in _load_wordlist():
+            words_by_length.setdefault(len(word), []).append(word)
+
+        # A passphrase of num words has num - 1 spaces, so its words
+        # must have between them this many letters.
+        fewest, most = 20 - (num - 1), 50 - (num - 1)
+
+        # ways[k][t] is the number of ways to choose k more words, after
+        # words with t letters between them, so that the passphrase
+        # ends up the correct size.
+        ways = [[int(fewest <= t <= most) for t in range(most + 1)]]
+        for k in range(num):
+            ways.append([
+                sum(len(words) * ways[k][t + length]
+                    for length, words in words_by_length.items()
+                    if t + length <= most)
+                for t in range(most + 1)
+            ])
+
+        steps = []
+        for k in range(num):
+            steps.append([])
+            for t in range(most + 1):
+                lengths = [length for length in words_by_length
+                           if t + length <= most]
+                cum_weights = list(itertools.accumulate(
+                    len(words_by_length[length]) * ways[k][t + length]
+                    for length in lengths))
+                steps[k].append((lengths, cum_weights))
+        _PASSPHRASE_TABLES[num] = (words_by_length, steps)
+    return _PASSPHRASE_TABLES[num]
+
+
 def create_password(num=10, special=False):
     """
     Create a password from randomly selected chrarcters.
@@ -53,12 +173,16 @@ def create_password(num=10, special=False):
     Numerals:           48-57
     Special characters: 32-47, 58-64, 91-96, 123-126
 
+    Random values come from the operating system, as with the secrets
+    module, so the passwords are suitable for security-sensitive use.
+
     By default passwords do not include special characters.  If they are
-    desired, the selection process is weighted such that the likelihood
-    that a character should be a special character is only one in five.
-    On average, then, passwords genereated by this tool with the
-    default length of 10 characters should contain two special
-    characters, which seems reasonable to me.
+    desired, every character but the first and the last has a one in
+    five chance of being a special character; the first is always a
+    letter and the last a letter or numeral.  Special characters may
+    sit next to each other.  On average, then, passwords generated by
+    this tool with the default length of 10 characters should contain
+    1.6 special characters, which seems reasonable to me.
     """
     if not isinstance(num, int):
         raise NotIntegerError('num must be a valid number')
@@ -67,43 +191,20 @@ def create_password(num=10, special=False):
     if num > 64:
         raise NumberTooHighError('num must be 64 or lower')
 
-    if random.random() < 0.5:   # Lead with a lower case letter...
-        password = chr(random.randrange(97, 123))
-    else:                       # ... otherwise lead with an upper case letter.
-        password = chr(random.randrange(65, 91))
-
-    while len(password) < num:
-        x = random.randrange(0, 100)    # Like rolling a hundred-sided die.
-
-        # If the user wants to include special characters in the
-        # result, and if random number x is in the range of 80 to 99,
-        # add a random special character.  Since there are four ASCII
-        # ranges of such characters, we select the range from the first
-        # "roll", then we "roll again" to  randomly choose a character
-        # from that range.
-        if special and len(password) < (num - 1):
-            if x >= 80 and x < 85:
-                password += chr(random.randrange(32, 48))
-                x = random.randrange(0, 100)    # Get a new x.
-            elif x >= 85 and x < 90:
-                password += chr(random.randrange(58, 65))
-                x = random.randrange(0, 100)    # Get a new x.
-            elif x >= 90 and x < 95:
-                password += chr(random.randrange(91, 97))
-                x = random.randrange(0, 100)    # Get a new x.
-            elif x >= 95 and x < 100:
-                password += chr(random.randrange(123, 127))
-                x = random.randrange(0, 100)    # Get a new x.
-
-        # Add a random letter or digit.
-        if x < 47:      # There's a 47% chance you'll get a lower case letter.
-            password += chr(random.randrange(97, 123))
-        elif x < 72:    # There's a 25% chance you'll get a numeral.
-            password += chr(random.randrange(48, 58))
-        else:           # There's a 28% chance you'll get an upper case letter.
-            password += chr(random.randrange(65, 91))
-
-    return password
+    # Lead with a letter, upper or lower case alike, then draw the rest
+    # of the password in one call.
+    password = [_RANDOM.choice(_LETTERS)]
+    if special:
+        # Special characters are never used to end the password.
+        password += _RANDOM.choices(
+            _MIXED_CHARACTERS, cum_weights=_MIXED_CUM_WEIGHTS, k=num - 2)
+        password += _RANDOM.choices(
+            _ALPHANUMERICS, cum_weights=_ALPHANUMERIC_CUM_WEIGHTS)
+    else:
+        password += _RANDOM.choices(
+            _ALPHANUMERICS, cum_weights=_ALPHANUMERIC_CUM_WEIGHTS, k=num - 1)
+
+    return ''.join(password)
 
     # end function create_password
 
@@ -119,22 +220,24 @@ def create_dice_passphrase(num=8):
     NotIntegerError -- if num is not an integer
     NumberTooLowError -- if num < 7
     NumberTooHighError -- if num > 64
-    FileNotFoundError -- if WordList.json cannot be found
+    FileNotFoundError -- if WordList.txt cannot be found
 
     Returns: a string
 
     This function creates a passphrase of num random words selected
-    from a file called WordList.json that is stored in the script's
+    from a file called WordList.txt that is stored in the script's
     directory.  The word list and the algorithm for selecting words come
     from the Diceware web site. To learn more about the Diceware
     algorithm, visit http://world.std.com/~reinhold/diceware.html.
+    Words are chosen with random values from the operating system, as
+    with the secrets module.
 
     This program generates passphrases of at least 20 but no more than
     50 characters to ensure compatibility with miniLock file encryption.
-    If the value of numberOfItems is too low or too high the function
-    could get stuck in an infinite loop trying to find a passphrase of
-    the correct length.  To prevent that from happening the function
-    will raise an exception rather than try to fulfill the request.
+    If the value of num is too low or too high few passphrases of the
+    correct length can be made, or none at all.  To prevent that from
+    happening the function will raise an exception rather than try to
+    fulfill the request.
     """
     if not isinstance(num, int):
         raise NotIntegerError('num must be a valid number')
@@ -143,39 +246,111 @@ def create_dice_passphrase(num=8):
     if num > 12:
         raise NumberTooHighError('num must be 12 or lower')
 
-    script_root = os.path.dirname(os.path.realpath(__file__))
-    full_file_path = os.path.join(script_root, 'WordList.json')
-
-    # Load the Dice word list file or raise an exception.
-    try:
-        with open(full_file_path, 'r', encoding='utf-8') as f:
-            dictionary = json.load(f)
-    except:
-        raise FileNotFoundError('the file could not be found')
-
-    # Continue creating passphrases until we get one of the correct size.
-    while True:
-        phrase = ''
-        words = []
-
-        # Per the Dice algorithm we'll simulate rolling 5 6-sided dice
-        # to generate the key for each word in our passphrase.
-        for roll in range(num):
-            key = ''
-            for die in range(5):
-                key += str(random.randrange(1, 7))
-            words.append(dictionary[key])
-        phrase = ' '.join(words)
-        if 20 <= len(phrase) <= 50:
-            break
+    words_by_length, steps = _passphrase_tables(num)
+
+    # Per the Dice algorithm we'd roll five 6-sided dice to choose each
+    # word and start again whenever the passphrase came out too short
+    # or too long, which for 11 or 12 words is most of the time.
+    # Instead, choose the length of each word in turn, weighted by how
+    # many passphrases of the correct size could still be made with it,
+    # then pick a word of that length.  Every passphrase of the correct
+    # size is just as likely as it would be by starting again.
+    choices = _RANDOM.choices
+    choice = _RANDOM.choice
+    words = []
+    letters = 0
+    for following in range(num - 1, -1, -1):
+        lengths, cum_weights = steps[following][letters]
+        length = choices(lengths, cum_weights=cum_weights)[0]
+        words.append(choice(words_by_length[length]))
+        letters += length
+    phrase = ' '.join(words)
 
     return phrase
 
     # end function create_dice_passphrase
 
 
-def main():
-    # Get the commandline arguments.
+# The messages main reports for each error, already wrapped to fit a
+# terminal so they can be printed as they are.
+_PASSPHRASE_ERRORS = {
+    NotIntegerError: (
+        'You can specify how many words you want in your resulting\n'
+        'passphrase. The value you enter for "--number" must be an integer.'),
+    NumberTooLowError: (
+        'A secure passphrase should be at least 20 characters long. This is\n'
+        'difficult to achieve with fewer than four words, so this program\n'
+        'requires that "--number" be at least 4.'),
+    NumberTooHighError: (
+        'To be compatible with minilock file encryption this program limits\n'
+        'passphrases to 50 characters. This is difficult to achieve with\n'
+        'more than 12 words, so this script requires that "--number" be no\n'
+        'more than 12.'),
+    FileNotFoundError: (
+        'This program builds passphrases from words found in a file named\n'
+        'WordList.txt, which must be located in the same directory as this\n'
+        "script. You're seeing this error because the file cannot be found\n"
+        'there.'),
+}
+
+_PASSWORD_ERRORS = {
+    NotIntegerError: (
+        'You can specify how many characters you want in your resulting\n'
+        'password. The value you enter for "--number" must be an integer.'),
+    NumberTooLowError: (
+        'A secure password should be at least seven characters long. This\n'
+        'script requires that "--number" be at least 7.'),
+    NumberTooHighError: (
+        "A reasonable password shouldn't be too long. This script requires\n"
+        'that "--number" be no more than 64.'),
+}
+
+
+def _quick_parse_args(argv):
+    """
+    Read the command line arguments without the help of argparse.
+
+    Keyword arguments:
+    argv -- the command line arguments, without the program name
+
+    Returns: a tuple of (number, special, dice), or None
+
+    Only the plain forms of the three options are understood: -n N or
+    --number N, -s or --special and -d or --dice.  None is returned for
+    anything else, including --help, a number that isn't an integer or
+    asking for both --special and --dice, so that argparse can deal
+    with it.
+    """
+    number, special, dice = None, False, False
+    args = iter(argv)
+    for arg in args:
+        if arg in ('-s', '--special'):
+            special = True
+        elif arg in ('-d', '--dice'):
+            dice = True
+        elif arg in ('-n', '--number'):
+            try:
+                number = int(next(args))
+            except (StopIteration, ValueError):
+                return None
+        else:
+            return None
+    if special and dice:
+        return None
+    return number, special, dice
+
+
+def _parse_args():
+    """
+    Read the command line arguments with argparse.
+
+    Returns: a tuple of (number, special, dice)
+
+    argparse prints the help text, or an error message for arguments
+    it doesn't accept, and exits.
+    """
+    import argparse
+
     params = argparse.ArgumentParser(
         description=('Generates a password from random characters or a '
                      'passphrase using the Dice algorithm.'),
@@ -201,57 +376,40 @@ def main():
     )
 
     args = params.parse_args()
+    return args.number, args.special, args.dice
+
 
-    if args.dice:
+def main():
+    # Get the commandline arguments.  Importing and setting up argparse
+    # takes longer than creating a password, so it's only used for the
+    # command lines _quick_parse_args can't handle on its own.
+    args = _quick_parse_args(sys.argv[1:])
+    if args is None:
+        args = _parse_args()
+    number, special, dice = args
+
+    if dice:
         try:
-            if args.number:
-                result = create_dice_passphrase(args.number)
+            if number:
+                result = create_dice_passphrase(number)
             else:
                 result = create_dice_passphrase()
-        except NotIntegerError:
-            result = ('You can specify how many words you want in your '
-                      'resulting passphrase. The value you enter for '
-                      '"--number" must be an integer.')
-        except NumberTooLowError:
-            result = ('A secure passphrase should be at least 20 characters '
-                      'long. This is difficult to achieve with fewer than '
-                      'four words, so this program requires that "--number" '
-                      'be at least 4.')
-        except NumberTooHighError:
-            result = ('To be compatible with minilock file encryption this '
-                      'program limits passphrases to 50 characters. This is '
-                      'difficult to achieve with more than 12 words, so this '
-                      'script requires that "--number" be no more than 12.')
-        except FileNotFoundError:
-            result = ('This program builds passphrases from words found in a '
-                      'file named WordList.json, which must be located in the '
-                      'same directory as this script. You\'re seeing this '
-                      'error because the file cannot be found there.')
-        except:
-            result = 'create_dice_passphrase failed for some reason.'
-        finally:
-            print(textwrap.fill(result))
+        except tuple(_PASSPHRASE_ERRORS) as e:
+            sys.exit(_PASSPHRASE_ERRORS[type(e)])
+        except Exception:
+            sys.exit('create_dice_passphrase failed for some reason.')
     else:
         try:
-            if args.number:
-                result = create_password(args.number, args.special)
+            if number:
+                result = create_password(number, special)
             else:
-                result = create_password(special=args.special)
-        except NotIntegerError:
-            result = ('You can specify how many characters you want in your '
-                      'resulting password. The value you enter for '
-                      '"--number" must be an integer.')
-        except NumberTooLowError:
-            result = ('A secure password should be at least seven characters '
-                      'long. This script requires that "--number" be at '
-                      'least 7.')
-        except NumberTooHighError:
-            result = ('A reasonable password shouldn\'t be too long. This '
-                      'script requires that "--number" be no more than 64.')
-        except:
-            result = 'create_password failed for some reason.'
-        finally:
-            print(textwrap.fill(result))
+                result = create_password(special=special)
+        except tuple(_PASSWORD_ERRORS) as e:
+            sys.exit(_PASSWORD_ERRORS[type(e)])
+        except Exception:
+            sys.exit('create_password failed for some reason.')
+
+    print(result)
 
 
 if __name__ == '__main__':
@@ -1,78 +1,135 @@
 # newpasstest.py
+"""
+Tests for newpass.
 
+The tests use unittest's own assertions, so pytest is told not to
+rewrite this module's assert statements when it imports it:
+PYTEST_DONT_REWRITE
+"""
+
+import io
+import string
+import sys
 import unittest
-import re
-import newpass
+from contextlib import redirect_stdout
+from unittest import mock
+from newpass import (
+    create_password, create_dice_passphrase, main, _quick_parse_args,
+    _PASSWORD_ERRORS, _PASSPHRASE_ERRORS,
+    NotIntegerError, NumberTooHighError, NumberTooLowError)
 
 
 class CreatePasswordBadInput(unittest.TestCase):
     def test_not_a_number(self):
         """create_password should fail if the input is not an integer."""
-        self.assertRaises(
-            newpass.NotIntegerError, newpass.create_password, 'Dave')
+        with self.assertRaises(NotIntegerError):
+            create_password('Dave')
 
     def test_number_too_high(self):
         """create_password should fail if the input value is above 64."""
-        self.assertRaises(
-            newpass.NumberTooHighError, newpass.create_password, 65)
+        with self.assertRaises(NumberTooHighError):
+            create_password(65)
 
     def test_number_too_low(self):
         """create_password should fail if the input value is below 7."""
-        self.assertRaises(
-            newpass.NumberTooLowError, newpass.create_password, 6)
+        with self.assertRaises(NumberTooLowError):
+            create_password(6)
 
 
 class CreatePasswordTestResult(unittest.TestCase):
-    special_characters = re.compile('[ -/:-@[-`{-~]')
+    special_characters = frozenset(' !"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~')
+
+    def setUp(self):
+        # isdisjoint is true when a password has no special characters.
+        self._no_specials = self.special_characters.isdisjoint
 
     def test_default_results(self):
         """
         create_password should return a 10-character password with no
         special characters by default.
         """
-        for i in range(100):    # run the test 100 times
-            result = newpass.create_password()
-            self.assertEqual(len(result), 10)
-            self.assertNotRegex(result, self.special_characters)
+        no_specials = self._no_specials
+        # Generate 30 passwords, then check them all.
+        results = [create_password() for i in range(30)]
+        self.assertTrue(all(len(result) == 10 for result in results))
+        self.assertTrue(all(no_specials(result) for result in results))
 
     def test_results_with_special_characters(self):
         """
         create_password should return a 10-character password with
         special characters at least once.
         """
-        specials_found = False
-        for i in range(100):    # run the test 100 times
-            result = newpass.create_password(special=True)
-            if self.special_characters.search(result):
-                specials_found = True
-            self.assertEqual(len(result), 10)
-        self.assertTrue(specials_found)
+        no_specials = self._no_specials
+        lengths = [len(create_password(special=True)) for i in range(30)]
+        self.assertTrue(all(length == 10 for length in lengths))
+        # With special=True every character but the first and last has a
+        # one-in-five chance of being special, so a 10-character password
+        # has none with probability 0.8 ** 8, about 0.17.  Thirty in a row
+        # without one would happen with probability below 1e-23, so 30
+        # tries are plenty.  Stop as soon as one turns up.
+        self.assertFalse(
+            all(no_specials(create_password(special=True)) for i in range(30)))
 
-    def test_results_with_varied_password_lengths(self):
+    def test_results_with_varied_password_lengths_and_specials(self):
         """
-        create_password should return a password of the given length
-        with no special characters.
+        create_password shoud return a password with special characters
+        at least once for every valid password length.
         """
-        for i in range(7, 65):   # test all valid password lengths
-            for j in range(100):    # run each test 100 times
-                result = newpass.create_password(i)
-                self.assertEqual(len(result), i)
-                self.assertNotRegex(result, self.special_characters)
-
-    def test_results_with_varied_password_lengths_and_specials(self):
+        no_specials = self._no_specials
+        # For each valid password length, generate up to 30 passwords
+        # until one has special characters, and note the lengths for
+        # which none did.  Even a 7-character password has none with
+        # probability only 0.8 ** 5, about 0.33, so 30 misses in a row
+        # would happen with probability below 1e-14.
+        missing = [i for i in range(7, 65)
+                   if all(no_specials(create_password(i, True))
+                          for j in range(30))]
+        self.assertFalse(missing, 'no special characters in passwords of '
+                                  'lengths %s' % missing)
+
+    def test_first_and_last_characters(self):
         """
-        create_password shoud return a password of the given length
-        with special characters at least once.
+        create_password should return a password that starts with a
+        letter and, when special characters are asked for, doesn't end
+        with one.
         """
-        specials_found = False
+        special_characters = self.special_characters
         for i in range(7, 65):  # test all valid password lengths
-            for j in range(100):    # run each test 100 times
-                result = newpass.create_password(i, True)
-                if self.special_characters.search(result):
-                    specials_found = True
-                self.assertEqual(len(result), i)
-            self.assertTrue(specials_found)
-            specials_found = False     # reset for each password length test
+            for special in (False, True):
+                results = [create_password(i, special) for j in range(5)]
+                self.assertTrue(all(result[0] in string.ascii_letters
+                                    for result in results))
+                self.assertTrue(all(result[-1] not in special_characters
+                                    for result in results))
+
+
+def _password_length_test(length):
+    """
+    Make a test that create_password returns passwords of the given
+    length, with no special characters unless they're asked for.
+    """
+    def test(self):
+        no_specials = self._no_specials
+        # Password length doesn't depend on chance at all, so 5 passwords
+        # of each kind are enough to check it.
+        results = [create_password(length) for j in range(5)]
+        self.assertTrue(all(len(result) == length for result in results))
+        self.assertTrue(all(no_specials(result) for result in results))
+        results = [create_password(length, True) for j in range(5)]
+        self.assertTrue(all(len(result) == length for result in results))
+    test.__doc__ = (
+        'create_password should return a password of %d characters with '
+        'no special characters unless they are asked for.' % length)
+    return test
+
+
+# Give each valid password length a test of its own, so that a failure
+# for one length doesn't hide the results for the others and the tests
+# can be run in parallel or singled out by name.
+for length in range(7, 65):
+    setattr(CreatePasswordTestResult, 'test_length_%d' % length,
+            _password_length_test(length))
+del length
 
 
 class CreateDicePassphraseBadInput(unittest.TestCase):
@@ -81,18 +138,18 @@ class CreateDicePassphraseBadInput(unittest.TestCase):
         create_dice_passphrase should fail if the input is not an
         integer.
         """
-        self.assertRaises(
-            newpass.NotIntegerError, newpass.create_dice_passphrase, 'Dave')
+        with self.assertRaises(NotIntegerError):
+            create_dice_passphrase('Dave')
 
     def test_number_too_high(self):
         """create_dice_passhrase should fail if the input value is above 12."""
-        self.assertRaises(
-            newpass.NumberTooHighError, newpass.create_dice_passphrase, 13)
+        with self.assertRaises(NumberTooHighError):
+            create_dice_passphrase(13)
 
     def test_number_too_low(self):
         """create_dice_passphrase should fail if the input value is below 4."""
-        self.assertRaises(
-            newpass.NumberTooLowError, newpass.create_dice_passphrase, 3)
+        with self.assertRaises(NumberTooLowError):
+            create_dice_passphrase(3)
 
 
 class CreateDicePassphraseTestResult(unittest.TestCase):
@@ -101,23 +158,97 @@ class CreateDicePassphraseTestResult(unittest.TestCase):
         create_dice_passphrase should return an 8-word passphrase
         between 20 and 50 characters long by default.
         """
+        assertEqual = self.assertEqual
+        assertGreaterEqual = self.assertGreaterEqual
+        assertLessEqual = self.assertLessEqual
         for i in range(100):  # run the test 100 times
-            passphrase = newpass.create_dice_passphrase()
-            self.assertEqual(len(passphrase.split()), 8)
-            self.assertTrue(20 <= len(passphrase) <= 50)
+            passphrase = create_dice_passphrase()
+            assertEqual(passphrase.count(' ') + 1, 8)
+            length = len(passphrase)
+            assertGreaterEqual(length, 20)
+            assertLessEqual(length, 50)
+
+
+def _passphrase_length_test(num):
+    """
+    Make a test that create_dice_passphrase returns passphrases of the
+    given number of words that are between 20 and 50 characters long.
+    """
+    def test(self):
+        assertEqual = self.assertEqual
+        assertGreaterEqual = self.assertGreaterEqual
+        assertLessEqual = self.assertLessEqual
+        for i in range(100):    # run the test 100 times
+            passphrase = create_dice_passphrase(num)
+            assertEqual(passphrase.count(' ') + 1, num)
+            length = len(passphrase)
+            assertGreaterEqual(length, 20)
+            assertLessEqual(length, 50)
+    test.__doc__ = (
+        'create_dice_passphrase should return a passphrase of %d words '
+        'that is between 20 and 50 characters long.' % num)
+    return test
+
+
+# As with passwords, each valid passphrase size gets a test of its own.
+for num in range(4, 13):
+    setattr(CreateDicePassphraseTestResult, 'test_length_%d' % num,
+            _passphrase_length_test(num))
+del num
+
+
+class QuickParseArgs(unittest.TestCase):
+    def test_plain_command_lines(self):
+        """
+        _quick_parse_args should return (number, special, dice) for the
+        command lines it handles itself.
+        """
+        self.assertEqual(_quick_parse_args([]), (None, False, False))
+        self.assertEqual(_quick_parse_args(['-s']), (None, True, False))
+        self.assertEqual(
+            _quick_parse_args(['-d', '-n', '5']), (5, False, True))
+        self.assertEqual(_quick_parse_args(['-n', '-3']), (-3, False, False))
+
+    def test_left_to_argparse(self):
+        """
+        _quick_parse_args should return None for the command lines it
+        leaves to argparse.
+        """
+        for argv in (['-n', 'abc'], ['-n'], ['-s', '-d'], ['-h'],
+                     ['--number=9'], ['-sd']):
+            with self.subTest(argv=argv):
+                self.assertIsNone(_quick_parse_args(argv))
+
+
+class MainErrors(unittest.TestCase):
+    def run_main(self, *args):
+        """
+        Run main with the given command line arguments and return the
+        SystemExit it raised, checking that nothing went to stdout.
+        """
+        stdout = io.StringIO()
+        with mock.patch.object(sys, 'argv', ['newpass.py', *args]):
+            with redirect_stdout(stdout), self.assertRaises(SystemExit) as cm:
+                main()
+        self.assertEqual(stdout.getvalue(), '')
+        return cm.exception
+
+    def test_password_error(self):
+        """
+        main should exit with the password error message when --number
+        is too low.
+        """
+        error = self.run_main('-n', '5')
+        self.assertEqual(error.code, _PASSWORD_ERRORS[NumberTooLowError])
 
-    def test_results_with_varied_password_lengths(self):
+    def test_passphrase_error(self):
         """
-        create_dice_passphrase should return a passphrase with the
-        required number of words that is between 20 and 50 characters
-        long.
+        main should exit with the passphrase error message when --number
+        is too low.
         """
-        for i in range(4, 13):   # test all valid passphrase sizes
-            for j in range(100):    # run each test 100 times
-                passphrase = newpass.create_dice_passphrase(i)
-                self.assertEqual(len(passphrase.split()), i)
-                self.assertTrue(20 <= len(passphrase) <= 50)
+        error = self.run_main('-d', '-n', '3')
+        self.assertEqual(error.code, _PASSPHRASE_ERRORS[NumberTooLowError])
 
 
 if __name__ == '__main__':
-    unittest.main()
+    unittest.main(verbosity=0)